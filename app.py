@@ -1,13 +1,19 @@
 # Streamlit Excel Validation App
 # Validates uploaded Excel files against specified rules and exports a styled Excel with highlights and messages.
 
-import io
+import hashlib
+import html
+import os
+import tempfile
+import time
+from collections import defaultdict
 from io import BytesIO
 from typing import Dict, List, Tuple, Any
 
+import numpy as np
 import pandas as pd
 import streamlit as st
-from openpyxl.styles import PatternFill, Alignment
+import xlsxwriter
 
 # -----------------------------
 # Configuration
@@ -54,319 +60,574 @@ MANDATORY_FIELDS = [
 # Valid ranges/maps
 ASSET_USAGE_MIN, ASSET_USAGE_MAX = 38, 56  # inclusive
 VALUE_BASE_MIN, VALUE_BASE_MAX = 1, 9      # inclusive
-MARKET_APPROACH_ALLOWED = {0, 1, 2}
+MARKET_APPROACH_ALLOWED = np.array([0, 1, 2])  # array rather than set so np.isin uses it as is
+MARKET_APPROACH_ALLOWED.flags.writeable = False
 
-# Colors (ARGB) for fills
-FILL_RED = PatternFill(start_color="FFFFC7CE", end_color="FFFFC7CE", fill_type="solid")     # Errors - critical
-FILL_YELLOW = PatternFill(start_color="FFDE21", end_color="FFDE21", fill_type="solid")  # Missing mandatory/problem fields
-FILL_ORANGE = PatternFill(start_color="FFFFE4B5", end_color="FFFFE4B5", fill_type="solid")  # Date issues
+# Low-cardinality columns (many rows, few distinct values) are read as categoricals,
+# so the checks on them parse each distinct value once instead of every row
+CATEGORICAL_COLUMNS = [
+    "asset_type",
+    "country",
+    "region",
+    "city",
+    "product_type",
+    "market_approach",
+    "value_base",
+    "asset_usage_id",
+]
+
+# Fill formats (xlsxwriter format properties)
+FILL_RED = {"bg_color": "#FFC7CE", "pattern": 1}     # Errors - critical
+FILL_YELLOW = {"bg_color": "#FFDE21", "pattern": 1}  # Missing mandatory/problem fields
+FILL_ORANGE = {"bg_color": "#FFE4B5", "pattern": 1}  # Date issues
+
+# Highlights are kept as one uint8 array per column (row position -> code) rather than one
+# dict entry per cell; when merging, np.maximum keeps the higher code
+HL_NONE, HL_YELLOW, HL_RED, HL_ORANGE = 0, 1, 2, 3
+FILL_BY_CODE = {HL_YELLOW: FILL_YELLOW, HL_RED: FILL_RED, HL_ORANGE: FILL_ORANGE}
+
+# Export cell styles; registered once per workbook and shared by every written cell
+ALIGN_RIGHT = {"align": "right"}  # RTL alignment to better handle Arabic
+HEADER_FORMAT = {"bold": True, "border": 1, **ALIGN_RIGHT}
+
+# Exports above this size spill from memory to a temporary file on disk
+EXPORT_SPOOL_MAX_SIZE = 50_000_000
+
+# In-memory st.cache_data bounds: each cached function keeps at most this many results
+# (one per recent upload/check), and drops any result after CACHE_TTL seconds
+CACHE_MAX_ENTRIES = 4
+CACHE_TTL = 60 * 60
+
+# Parsed uploads are also kept as Parquet files here (keyed by the sha1 of the upload), so the
+# same workbook uploaded again in a new session or after a restart skips Excel parsing.
+# Bump PARSE_VERSION whenever parse_excel or CATEGORICAL_COLUMNS change, so frames cached
+# by an older version are not served; files unused for PARQUET_CACHE_MAX_AGE seconds are deleted.
+PARQUET_CACHE_DIR = os.path.join(tempfile.gettempdir(), "excel_validator_cache")
+PARSE_VERSION = "1"
+PARQUET_CACHE_MAX_AGE = 24 * 60 * 60
+
+# Preview table: rows shown (the export always has every row) and its styles;
+# highlighted cells get class "hl", the others "ok"
+MAX_PREVIEW = 500
+PREVIEW_CSS = """
+<style>
+.preview-table { background-color: #fff; border-collapse: collapse; font-family: Segoe UI, Arial, sans-serif; font-size: 1em; }
+.preview-table th { background-color: #21a366; color: #fff; font-weight: bold; border: 1px solid #bdbdbd; text-align: center; }
+.preview-table td { color: #111; border: 1px solid #bdbdbd; text-align: center; }
+.preview-table td.ok { background-color: #fff; }
+.preview-table td.hl { background-color: #FFDE21; }
+</style>
+"""
 
 # -----------------------------
 # Utility functions
 # -----------------------------
 
-def is_empty(value: Any) -> bool:
-    """Return True if value should be considered empty.
+def normalize(s: pd.Series) -> pd.Series:
+    """Column as stripped strings (<NA> where missing), the form the vectorized checks below expect.
+    Categorical columns are returned as is; the checks normalize their (few) categories instead.
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    return s.astype("string").str.strip()
+
+
+def normalize_columns(df: pd.DataFrame, columns: List[str]) -> Dict[str, pd.Series]:
+    """normalize() each of columns present in df once, so the rules sharing a column don't redo it."""
+    return {col: normalize(df[col]) for col in columns if col in df.columns}
+
+
+def per_category(s: pd.Series, func) -> np.ndarray:
+    """Evaluate a vectorized check once per category of a categorical Series and broadcast
+    the result back to every row through the category codes.
+    """
+    distinct = pd.Series([*s.cat.categories, None], dtype=object)  # trailing None for code -1 (missing)
+    return np.asarray(func(normalize(distinct)))[s.cat.codes.to_numpy()]
+
+
+def empty_mask(s: pd.Series) -> pd.Series:
+    """Empty check over a normalize()d column: True where the value is missing or blank.
     '0' and 'N/A' (case-insensitive) are NOT considered empty.
     """
-    if value is None:
-        return True
-    if isinstance(value, float) and pd.isna(value):
-        return True
-    s = str(value).strip()
-    if s == "":
-        return True
-    if s.lower() == "n/a":
-        # Considered a valid placeholder, not empty
-        return False
-    if s == "0":
-        # 0 is valid for numeric/flag fields
-        return False
-    return False if s else True
-
-
-def to_int(value: Any) -> Tuple[bool, int | None]:
-    """Try to parse int without decimals. Returns (ok, int_value)."""
-    if is_empty(value):
-        return False, None
-    try:
-        # Allow numeric strings like '97000' but not '97000.5'
-        s = str(value).strip()
-        if s.lower().endswith(".0"):
-            s = s[:-2]
-        if "." in s:
-            return False, None
-        return True, int(s)
-    except Exception:
-        return False, None
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return pd.Series(per_category(s, empty_mask), index=s.index)
+    return (s.isna() | (s == "")).astype(bool)
 
 
-def to_float(value: Any) -> Tuple[bool, float | None]:
-    """Parse value to float. Returns (ok, float_value)."""
-    if is_empty(value):
-        return False, None
-    try:
-        return True, float(str(value).strip())
-    except Exception:
-        return False, None
+# Arabic-Indic and Eastern Arabic-Indic digits count as digits (as they do for int() and float())
+ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "0123456789" * 2)
 
 
-def parse_and_format_date(value: Any) -> Tuple[bool, str | None]:
-    """Try to parse a date and return it formatted as dd-mm-YYYY. If not parseable, return (False, None)."""
-    if is_empty(value):
-        return False, None
-    s = str(value).strip()
-    # Try multiple common formats, dayfirst where applicable
-    try:
-        dt = pd.to_datetime(s, dayfirst=True, errors="raise")
-        return True, dt.strftime("%d-%m-%Y")
-    except Exception:
-        return False, None
+def to_float_series(s: pd.Series) -> pd.Series:
+    """Parse a normalize()d column to a float64 Series, NaN where the value is empty or not a number."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return pd.Series(per_category(s, to_float_series), index=s.index)
+    return pd.to_numeric(s.str.translate(ARABIC_DIGITS), errors="coerce").astype("float64")
+
+
+def to_int_series(s: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Integer parse of a normalize()d column. Returns (is_int, num): is_int is True for
+    non-decimal integers ('97000' and '97000.0'; not '97000.5' or '1e5'), num the parsed number
+    (NA where not an integer).
+    """
+    digits = s.str.removesuffix(".0").str.translate(ARABIC_DIGITS)
+    is_int = digits.str.fullmatch(r"[+-]?[0-9]+").fillna(False).astype(bool)
+    num = pd.to_numeric(digits.where(is_int), errors="coerce")
+    return is_int, num
+
+
+def int_range_violations(s: pd.Series, lo: int, hi: int) -> np.ndarray:
+    """Integer parse + range check over a normalize()d column: True for non-empty values
+    that are not integers in [lo, hi].
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return per_category(s, lambda distinct: int_range_violations(distinct, lo, hi))
+    is_int, num = to_int_series(s)
+    bad = ~is_int | (num < lo) | (num > hi)  # num is a number wherever is_int holds
+    return (~empty_mask(s) & bad).to_numpy(dtype=bool)
+
+
+def hash_dataframe(df: pd.DataFrame) -> bytes:
+    """Content hash of a DataFrame (every row, index and column names) for st.cache_data keys."""
+    return pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes() + repr(list(df.columns)).encode()
+
+
+def hash_highlights(highlights: Dict[str, np.ndarray]) -> bytes:
+    """Content hash of a highlights dict (every column bitmap), passed to export_with_highlights
+    as its cache key. Each name and bitmap is length-prefixed, so different dicts can't collide.
+    """
+    h = hashlib.sha1()
+    for col, codes in highlights.items():
+        name = col.encode()
+        h.update(len(name).to_bytes(8, "little") + name)
+        h.update(codes.nbytes.to_bytes(8, "little") + codes.tobytes())
+    return h.digest()
+
+
+# Validators and the export are cached on the full content of their arguments.
+# Streamlit samples large DataFrames, so they get a dedicated full hash; the export's
+# highlights are keyed through hash_highlights (see export_with_highlights).
+CACHE_HASH_FUNCS = {
+    pd.DataFrame: hash_dataframe,
+}
+
 
 def check_missing_columns(df: pd.DataFrame) -> List[str]:
     missing = [c for c in EXPECTED_COLUMNS if c not in df.columns]
     return missing
 
 
-def validate_final_value_only(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[Tuple[int, str], PatternFill], List[str]]:
-    """Validate only final_value emptiness and integer-ness.
-    Writes the validation message directly into the offending cell and colors it yellow.
-    Returns updated df, cell highlights, and summary lines.
+def add_messages(messages: Dict[str, Dict[int, List[str]]], col: str, mask: Any, message: Any) -> int:
+    """Record message for every row of col where mask is True.
+    messages maps column -> row position -> list of messages; message is a single string
+    or an array with one message per row. Returns the number of flagged cells.
     """
-    df = df.copy()
+    positions = np.flatnonzero(np.asarray(mask, dtype=bool))
+    per_row = messages[col]
+    if isinstance(message, str):
+        for pos in positions.tolist():
+            per_row[pos].append(message)
+    else:
+        for pos, msg in zip(positions.tolist(), np.asarray(message, dtype=object)[positions]):
+            per_row[pos].append(msg)
+    return len(positions)
 
-    highlights: Dict[Tuple[int, str], PatternFill] = {}
-    summary: List[str] = []
-    issues = 0
-
-    if "final_value" in df.columns:
-        for idx, val in df["final_value"].items():
-            message = None
-            if is_empty(val):
-                message = "final_value is mandatory and cannot be empty"
-            else:
-                ok, _intval = to_int(val)
-                if not ok:
-                    message = "Final value must be a non-decimal integer"
-            if message:
-                issues += 1
-                highlights[(idx, "final_value")] = FILL_YELLOW
-                df.at[idx, "final_value"] = append_message(df.at[idx, "final_value"], message)
-
-    summary.append(f"Final Value issues: {issues}")
-    return df, highlights, summary
-
-
-def validate_mandatory_only(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[Tuple[int, str], PatternFill], List[str]]:
-    df = df.copy()
 
-    highlights: Dict[Tuple[int, str], PatternFill] = {}
-    summary: List[str] = []
+def apply_messages(df: pd.DataFrame, messages: Dict[str, Dict[int, List[str]]]) -> Dict[str, np.ndarray]:
+    """Write the collected messages into their cells (one join per cell, one assignment per column)
+    and return the highlights as one bitmap of highlight codes per flagged column.
+    """
+    highlights: Dict[str, np.ndarray] = {}
+    for col, per_row in messages.items():
+        if not per_row:
+            continue
+        positions = np.fromiter(per_row.keys(), dtype=np.intp, count=len(per_row))
+        values = df[col].to_numpy(dtype=object).copy()
+        values[positions] = [append_join(values[pos], msgs) for pos, msgs in per_row.items()]
+        df[col] = values
+        codes = np.zeros(len(df), dtype=np.uint8)
+        codes[positions] = HL_YELLOW
+        highlights[col] = codes
+    return highlights
 
-    missing_count = 0
 
+# -----------------------------
+# Validation rules
+# -----------------------------
+# Each rule reads the original cell values from normed (column -> normalize()d column, built
+# once per validation by normalize_columns), records its messages and returns its issue count.
+# The validators apply all collected messages at the end, so every cell is rewritten at most once.
+
+def check_final_value(normed: Dict[str, pd.Series], messages: Dict[str, Dict[int, List[str]]], skip_empty: bool = False) -> int:
+    """final_value must be present and a non-decimal integer.
+    skip_empty leaves empty cells alone, for when check_mandatory already reports them.
+    """
+    if "final_value" not in normed:
+        return 0
+    s = normed["final_value"]
+    empty = empty_mask(s)
+    # Allow numeric strings like '97000' and '97000.0' but not '97000.5'
+    is_int, _ = to_int_series(s)
+    non_int = ~empty & ~is_int
+
+    message = np.where(
+        empty.to_numpy(),
+        "final_value is mandatory and cannot be empty",
+        "Final value must be a non-decimal integer",
+    )
+    flagged = non_int if skip_empty else empty | non_int
+    return add_messages(messages, "final_value", flagged.to_numpy(dtype=bool), message)
+
+
+def parse_market_approach(normed: Dict[str, pd.Series]) -> np.ndarray | None:
+    """market_approach as truncated floats (NaN where empty or not a number), or None if the column is missing.
+    Parsed once per validation and shared by the rules that depend on it.
+    """
+    if "market_approach" not in normed:
+        return None
+    return np.trunc(to_float_series(normed["market_approach"]).to_numpy())
+
+
+def check_mandatory(normed: Dict[str, pd.Series], messages: Dict[str, Dict[int, List[str]]], approach: np.ndarray | None = None) -> int:
+    """Mandatory fields must not be empty (with the market_approach exceptions).
+    approach is the parse_market_approach result, computed here when not given.
+    """
+    if approach is None:
+        approach = parse_market_approach(normed)
+    missing_count = 0
     for col in MANDATORY_FIELDS:
-        if col not in df.columns:
+        if col not in normed:
             continue  # Column presence is checked elsewhere; here we only mark empty values
-        for idx, val in df[col].items():
-            if is_empty(val):
-                # Special case: market_approach can be empty => treat as 0 (allowed) - not flagged here
-                if col == "market_approach":
-                    continue
-                # For market_approach_value: allow empty if approach is 0/empty
-                if col == "market_approach_value":
-                    try:
-                        approach_raw = df.at[idx, "market_approach"] if "market_approach" in df.columns else ""
-                        approach = 0 if is_empty(approach_raw) else int(float(str(approach_raw).strip()))
-                    except Exception:
-                        approach = None
-                    if approach in (0, None):
-                        continue  # ok to be empty
-                missing_count += 1
-                highlights[(idx, col)] = FILL_YELLOW
-                df.at[idx, col] = append_message(df.at[idx, col], "This mandatory field is empty")
-
-    summary.append(f"Missing mandatory values: {missing_count}")
-    return df, highlights, summary
-
-
-def validate_dates_only(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[Tuple[int, str], PatternFill], List[str]]:
+        # Special case: market_approach can be empty => treat as 0 (allowed) - not flagged here
+        if col == "market_approach":
+            continue
+        mask = empty_mask(normed[col]).to_numpy()
+        # For market_approach_value: allow empty if approach is 0/empty (or unparseable)
+        if col == "market_approach_value":
+            if approach is None:
+                continue
+            mask &= np.isfinite(approach) & (approach != 0)
+        missing_count += add_messages(messages, col, mask, "This mandatory field is empty")
+    return missing_count
+
+
+def check_dates(df: pd.DataFrame, normed: Dict[str, pd.Series], messages: Dict[str, Dict[int, List[str]]], skip_empty: bool = False) -> Tuple[int, int]:
+    """inspection_date must be a date; valid dates are rewritten as dd-mm-YYYY in df.
+    skip_empty leaves empty cells alone, for when check_mandatory already reports them.
+    Returns (invalid_count, auto_fixed).
+    """
+    s = normed["inspection_date"]
+    empty = empty_mask(s).to_numpy()
+    # Dates repeat heavily (a whole batch is often inspected on one day), so parse and
+    # format each distinct value once and map back; format="mixed" keeps per-value inference
+    codes, uniques = pd.factorize(s)
+    parsed = pd.to_datetime(uniques, dayfirst=True, errors="coerce", format="mixed")
+    if isinstance(parsed, pd.DatetimeIndex):
+        formatted_uniques = parsed.strftime("%d-%m-%Y").to_numpy(dtype=object)
+    else:
+        # Differing UTC offsets come back as a plain object Index; parse each value on its own
+        # instead (utc=True would shift the day)
+        stamps = [pd.to_datetime(u, dayfirst=True, errors="coerce", format="mixed") for u in uniques]
+        formatted_uniques = np.array([None if pd.isna(t) else t.strftime("%d-%m-%Y") for t in stamps], dtype=object)
+    formatted = np.append(formatted_uniques, None)[codes]  # code -1 = missing
+    valid = pd.notna(formatted) & ~empty
+    invalid = ~valid & ~empty if skip_empty else ~valid
+
+    values = df["inspection_date"].to_numpy(dtype=object).copy()
+    # Auto-fix to desired format
+    values[valid] = formatted[valid]
+    df["inspection_date"] = values
+    invalid_count = add_messages(messages, "inspection_date", invalid, "Date must be in dd-mm-YYYY format")
+    return invalid_count, int(valid.sum())
+
+
+def check_additional_rules(normed: Dict[str, pd.Series], messages: Dict[str, Dict[int, List[str]]], approach: np.ndarray | None = None) -> int:
+    """Numeric/range checks. Empty cells are left to the mandatory check.
+    approach is the parse_market_approach result, computed here when not given.
+    """
+    if approach is None:
+        approach = parse_market_approach(normed)
+    extra_issues = 0
+    # asset_usage_id: integer 38..56
+    if "asset_usage_id" in normed:
+        bad = int_range_violations(normed["asset_usage_id"], ASSET_USAGE_MIN, ASSET_USAGE_MAX)
+        extra_issues += add_messages(messages, "asset_usage_id", bad, f"asset_usage_id must be in [{ASSET_USAGE_MIN}-{ASSET_USAGE_MAX}]")
+
+    # value_base: integer 1..9
+    if "value_base" in normed:
+        bad = int_range_violations(normed["value_base"], VALUE_BASE_MIN, VALUE_BASE_MAX)
+        extra_issues += add_messages(messages, "value_base", bad, f"value_base must be in [{VALUE_BASE_MIN}-{VALUE_BASE_MAX}]")
+
+    # market_approach: 0,1,2 (empty treated as 0)
+    if approach is not None:
+        bad = ~empty_mask(normed["market_approach"]).to_numpy() & ~np.isin(approach, MARKET_APPROACH_ALLOWED)
+        extra_issues += add_messages(messages, "market_approach", bad, "market_approach must be 0, 1, or 2")
+
+    # market_approach_value: must be provided and numeric if approach in {1,2}; allowed empty if approach 0/empty
+    if "market_approach_value" in normed and approach is not None:
+        # An empty value here is already reported by check_mandatory (approach is 1 or 2)
+        value = to_float_series(normed["market_approach_value"]).to_numpy()
+        bad = np.isin(approach, [1, 2]) & np.isnan(value) & ~empty_mask(normed["market_approach_value"]).to_numpy()
+        extra_issues += add_messages(messages, "market_approach_value", bad, "Must be a number when approach is 1 or 2")
+
+    # production_capacity: if provided, must be non-negative number (it's mandatory; emptiness handled already)
+    if "production_capacity" in normed:
+        capacity = to_float_series(normed["production_capacity"]).to_numpy()
+        bad = ~empty_mask(normed["production_capacity"]).to_numpy() & ~(capacity >= 0)
+        extra_issues += add_messages(messages, "production_capacity", bad, "Must be a non-negative number")
+
+    return extra_issues
+
+
+# -----------------------------
+# Validators
+# -----------------------------
+
+# Each validator returns (df, highlights, summary, counts): the updated df, the highlight bitmaps,
+# the summary lines to display and the issue count of every check it ran (check name -> count).
+
+@st.cache_data(show_spinner=False, hash_funcs=CACHE_HASH_FUNCS, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def validate_final_value_only(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, np.ndarray], List[str], Dict[str, int]]:
+    """Validate only final_value emptiness and integer-ness.
+    Writes the validation message directly into the offending cell and colors it yellow.
+    Returns updated df, cell highlights, summary lines and issue counts.
+    """
     df = df.copy()
+    messages: Dict[str, Dict[int, List[str]]] = defaultdict(lambda: defaultdict(list))
+    normed = normalize_columns(df, ["final_value"])
+    counts = {"final_value": check_final_value(normed, messages)}
+    highlights = apply_messages(df, messages)
+    return df, highlights, [f"Final Value issues: {counts['final_value']}"], counts
+
+
+@st.cache_data(show_spinner=False, hash_funcs=CACHE_HASH_FUNCS, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def validate_mandatory_only(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, np.ndarray], List[str], Dict[str, int]]:
+    df = df.copy()
+    messages: Dict[str, Dict[int, List[str]]] = defaultdict(lambda: defaultdict(list))
+    counts = {"mandatory": check_mandatory(normalize_columns(df, MANDATORY_FIELDS), messages)}
+    highlights = apply_messages(df, messages)
+    return df, highlights, [f"Missing mandatory values: {counts['mandatory']}"], counts
+
 
-    highlights: Dict[Tuple[int, str], PatternFill] = {}
+@st.cache_data(show_spinner=False, hash_funcs=CACHE_HASH_FUNCS, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def validate_dates_only(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, np.ndarray], List[str], Dict[str, int]]:
+    df = df.copy()
+    messages: Dict[str, Dict[int, List[str]]] = defaultdict(lambda: defaultdict(list))
     summary: List[str] = []
 
     invalid_count = 0
     auto_fixed = 0
-
     if "inspection_date" in df.columns:
-        for idx, val in df["inspection_date"].items():
-            if is_empty(val):
-                highlights[(idx, "inspection_date")] = FILL_YELLOW
-                df.at[idx, "inspection_date"] = append_message(df.at[idx, "inspection_date"], "Date must be in dd-mm-YYYY format")
-                invalid_count += 1
-                continue
-            ok, formatted = parse_and_format_date(val)
-            if ok and formatted:
-                # Auto-fix to desired format
-                df.at[idx, "inspection_date"] = formatted
-                auto_fixed += 1
-            else:
-                highlights[(idx, "inspection_date")] = FILL_YELLOW
-                df.at[idx, "inspection_date"] = append_message(df.at[idx, "inspection_date"], "Date must be in dd-mm-YYYY format")
-                invalid_count += 1
+        invalid_count, auto_fixed = check_dates(df, normalize_columns(df, ["inspection_date"]), messages)
     else:
         summary.append("Column 'inspection_date' is missing")
 
     summary.append(f"Invalid dates: {invalid_count}")
     if auto_fixed:
         summary.append(f"Dates auto-formatted: {auto_fixed}")
-    return df, highlights, summary
+    highlights = apply_messages(df, messages)
+    return df, highlights, summary, {"dates": invalid_count}
 
 
-def validate_all(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[Tuple[int, str], PatternFill], List[str]]:
+@st.cache_data(show_spinner=False, hash_funcs=CACHE_HASH_FUNCS, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def validate_all(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, np.ndarray], List[str], Dict[str, int]]:
     """Run all validations: mandatory emptiness, final value integer, date format, and range checks.
-    Messages are written directly inside the invalid cells and colored accordingly.
+    All rules run in a single pass over the original values; messages are then written inside
+    the invalid cells and colored accordingly.
     """
     df = df.copy()
-
-    highlights: Dict[Tuple[int, str], PatternFill] = {}
+    messages: Dict[str, Dict[int, List[str]]] = defaultdict(lambda: defaultdict(list))
     summary: List[str] = []
+    counts: Dict[str, int] = {}
+    # Every checked column is mandatory: strip each one once, shared by all the rules below
+    normed = normalize_columns(df, MANDATORY_FIELDS)
+    # Shared by the mandatory exemption and the market_approach/market_approach_value rules
+    approach = parse_market_approach(normed)
 
     # 1) Mandatory non-empty (with allowed exceptions)
-    df, hl_mand, sum_mand = validate_mandatory_only(df)
-    highlights.update(hl_mand)
-    summary.extend(sum_mand)
+    counts["mandatory"] = check_mandatory(normed, messages, approach)
+    summary.append(f"Missing mandatory values: {counts['mandatory']}")
 
     # 2) Final value integer
-    df, hl_final, sum_final = validate_final_value_only(df)
-    highlights.update(hl_final)
-    summary.extend(sum_final)
+    # Empty mandatory cells are counted once, as missing mandatory values; the
+    # final_value and date checks below only report the cells that have a value
+    counts["final_value"] = check_final_value(normed, messages, skip_empty=True)
+    summary.append(f"Final Value issues: {counts['final_value']}")
 
     # 3) Dates
-    df, hl_dates, sum_dates = validate_dates_only(df)
-    highlights.update(hl_dates)
-    summary.extend(sum_dates)
+    invalid_count = 0
+    auto_fixed = 0
+    if "inspection_date" in df.columns:
+        invalid_count, auto_fixed = check_dates(df, normed, messages, skip_empty=True)
+    else:
+        summary.append("Column 'inspection_date' is missing")
+    counts["dates"] = invalid_count
+    summary.append(f"Invalid dates: {invalid_count}")
+    if auto_fixed:
+        summary.append(f"Dates auto-formatted: {auto_fixed}")
 
     # 4) Additional numeric/range checks
-    extra_issues = 0
-    # asset_usage_id: integer 38..56
-    if "asset_usage_id" in df.columns:
-        for idx, val in df["asset_usage_id"].items():
-            if is_empty(val):
-                continue  # already handled by mandatory check
-            ok, intval = to_int(val)
-            if not ok or intval is None or not (ASSET_USAGE_MIN <= intval <= ASSET_USAGE_MAX):
-                highlights[(idx, "asset_usage_id")] = FILL_YELLOW
-                df.at[idx, "asset_usage_id"] = append_message(df.at[idx, "asset_usage_id"], f"asset_usage_id must be in [{ASSET_USAGE_MIN}-{ASSET_USAGE_MAX}]")
-                extra_issues += 1
+    counts["additional"] = check_additional_rules(normed, messages, approach)
+    summary.append(f"Additional rule violations: {counts['additional']}")
 
-    # value_base: integer 1..9
-    if "value_base" in df.columns:
-        for idx, val in df["value_base"].items():
-            if is_empty(val):
-                continue
-            ok, intval = to_int(val)
-            if not ok or intval is None or not (VALUE_BASE_MIN <= intval <= VALUE_BASE_MAX):
-                highlights[(idx, "value_base")] = FILL_YELLOW
-                df.at[idx, "value_base"] = append_message(df.at[idx, "value_base"], f"value_base must be in [{VALUE_BASE_MIN}-{VALUE_BASE_MAX}]")
-                extra_issues += 1
+    highlights = apply_messages(df, messages)
+    return df, highlights, summary, counts
 
-    # market_approach: 0,1,2 (empty treated as 0)
-    if "market_approach" in df.columns:
-        for idx, val in df["market_approach"].items():
-            if is_empty(val):
-                # treat as 0
-                continue
-            ok, fval = to_float(val)
-            if not ok or fval is None or int(fval) not in MARKET_APPROACH_ALLOWED:
-                highlights[(idx, "market_approach")] = FILL_YELLOW
-                df.at[idx, "market_approach"] = append_message(df.at[idx, "market_approach"], "market_approach must be 0, 1, or 2")
-                extra_issues += 1
 
-    # market_approach_value: must be provided and numeric if approach in {1,2}; allowed empty if approach 0/empty
-    if "market_approach_value" in df.columns:
-        for idx, val in df["market_approach_value"].items():
-            approach_raw = df.at[idx, "market_approach"] if "market_approach" in df.columns else ""
-            approach_empty = is_empty(approach_raw)
-            approach = 0
-            if not approach_empty:
-                try:
-                    approach = int(float(str(approach_raw).strip()))
-                except Exception:
-                    approach = None
-            if approach in (1, 2):
-                ok, fval = to_float(val)
-                if not ok or fval is None:
-                    highlights[(idx, "market_approach_value")] = FILL_YELLOW
-                    df.at[idx, "market_approach_value"] = append_message(df.at[idx, "market_approach_value"], "Must be a number when approach is 1 or 2")
-                    extra_issues += 1
+# -----------------------------
+# Styling export
+# -----------------------------
 
-    # production_capacity: if provided, must be non-negative number (it's mandatory; emptiness handled already)
-    if "production_capacity" in df.columns:
-        for idx, val in df["production_capacity"].items():
-            if is_empty(val):
-                continue
-            ok, fval = to_float(val)
-            if not ok or fval is None or fval < 0:
-                highlights[(idx, "production_capacity")] = FILL_YELLOW
-                df.at[idx, "production_capacity"] = append_message(df.at[idx, "production_capacity"], "Must be a non-negative number")
-                extra_issues += 1
+def append_join(existing: Any, new_msgs: List[str]) -> str:
+    """Append all of a cell's messages to its value with a single join."""
+    s = "" if existing is None else str(existing).strip()
+    if not s or s.lower() == "nan":
+        return " | ".join(new_msgs)
+    return " | ".join([s, *new_msgs])
 
-    summary.append(f"Additional rule violations: {extra_issues}")
 
-    return df, highlights, summary
+@st.cache_data(show_spinner=False, hash_funcs=CACHE_HASH_FUNCS, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def export_with_highlights(df: pd.DataFrame, _highlights: Dict[str, np.ndarray], highlights_key: bytes) -> bytes:
+    """Export DataFrame to Excel with xlsxwriter and apply cell highlights.
+    _highlights maps column_name -> per-row array of highlight codes (see FILL_BY_CODE); st.cache_data
+    skips it (leading underscore) and keys on highlights_key = hash_highlights(_highlights) instead.
+    The workbook is written in constant_memory mode (each row is flushed once written) into
+    a spooled temporary file, so neither the worksheet nor the output is built in memory.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE) as tmp:
+        # Text stays text: no hyperlinks, and formulas only where the cell starts with '='
+        wb = xlsxwriter.Workbook(tmp, {"constant_memory": True, "in_memory": False, "strings_to_urls": False})
+        ws = wb.add_worksheet("Data")
+        format_by_code = {code: wb.add_format({**fill, **ALIGN_RIGHT}) for code, fill in FILL_BY_CODE.items()}
+
+        # Header: bold with borders (as pandas writes it), right-aligned for RTL readability
+        ws.write_row(0, 0, list(df.columns), wb.add_format(HEADER_FORMAT))
+
+        # Group highlights by row position -> {column position: highlight code}
+        col_pos_by_name = {name: i for i, name in enumerate(df.columns)}
+        codes_by_row: Dict[int, Dict[int, int]] = defaultdict(dict)
+        for col_name, codes in _highlights.items():
+            if col_name not in col_pos_by_name:
+                continue
+            col_pos = col_pos_by_name[col_name]
+            positions = np.flatnonzero(codes)
+            for row_pos, code in zip(positions.tolist(), codes[positions].tolist()):
+                codes_by_row[row_pos][col_pos] = code
+
+        # Empty cells stay empty (pandas writes NaN as a blank cell)
+        values = df.astype(object).where(df.notna(), None).to_numpy()
+        for row_pos in range(len(values)):
+            row = values[row_pos].tolist()
+            ws.write_row(row_pos + 1, 0, row)
+            # Rows must be written in order in constant_memory mode, so the highlighted
+            # cells of this row are rewritten with their format before moving on
+            for col_pos, code in codes_by_row.get(row_pos, {}).items():
+                ws.write(row_pos + 1, col_pos, row[col_pos], format_by_code[code])
+
+        wb.close()
+        tmp.seek(0)
+        return tmp.read()
 
 
 # -----------------------------
-# Styling export
+# Streamlit UI
 # -----------------------------
 
-def append_message(existing: Any, new_msg: str) -> str:
-    s = str(existing).strip()
-    if not s or s.lower() == "nan":
-        return new_msg
-    return f"{s} | {new_msg}"
+def parse_excel(data: bytes) -> pd.DataFrame:
+    """Parse workbook bytes into a DataFrame of strings, low-cardinality columns as categoricals."""
+    # Read as string to preserve formatting; we'll parse as needed.
+    # calamine (Rust) parses much faster than openpyxl; fall back when it isn't installed.
+    try:
+        df = pd.read_excel(BytesIO(data), dtype=str, engine="calamine")
+    except ImportError:
+        df = pd.read_excel(BytesIO(data), dtype=str, engine="openpyxl")
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def prune_parquet_cache() -> None:
+    """Delete cache files unused for PARQUET_CACHE_MAX_AGE and frames cached by another PARSE_VERSION."""
+    cutoff = time.time() - PARQUET_CACHE_MAX_AGE
+    suffix = f"-v{PARSE_VERSION}.parquet"
+    for entry in os.scandir(PARQUET_CACHE_DIR):
+        try:
+            stale_version = entry.name.endswith(".parquet") and not entry.name.endswith(suffix)
+            if stale_version or entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass  # already removed by another session
 
 
-def export_with_highlights(df: pd.DataFrame, highlights: Dict[Tuple[int, str], PatternFill]) -> bytes:
-    """Export DataFrame to Excel with openpyxl and apply cell highlights.
-    highlights keys are (row_index_in_df, column_name) -> PatternFill.
+def parquet_cache_dir() -> str | None:
+    """PARQUET_CACHE_DIR, created readable by this user only (uploads hold owner names and values).
+    None when it can't be used privately, e.g. it already exists and belongs to another user.
     """
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        # Write the DataFrame
-        df.to_excel(writer, index=False, sheet_name="Data")
-        ws = writer.sheets["Data"]
-
-        # Build column name -> Excel column index map
-        headers = [cell.value for cell in ws[1]]
-        col_index_by_name = {name: i + 1 for i, name in enumerate(headers)}  # 1-based
-
-        # Apply RTL alignment for text cells to better handle Arabic
-        right_align = Alignment(horizontal="right")
-
-        # Apply highlights
-        for (row_idx_df, col_name), fill in highlights.items():
-            if col_name not in col_index_by_name:
-                continue
-            row_xl = row_idx_df + 2  # +1 for header, +1 to convert 0-based to 1-based
-            col_xl = col_index_by_name[col_name]
-            cell = ws.cell(row=row_xl, column=col_xl)
-            cell.fill = fill
-            # Right-align for readability with RTL
-            cell.alignment = right_align
+    try:
+        os.makedirs(PARQUET_CACHE_DIR, mode=0o700, exist_ok=True)
+        if hasattr(os, "getuid") and os.stat(PARQUET_CACHE_DIR).st_uid != os.getuid():
+            return None
+        os.chmod(PARQUET_CACHE_DIR, 0o700)  # also tightens a directory left by an older version
+        return PARQUET_CACHE_DIR
+    except OSError:
+        return None
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def read_excel_file(data: bytes) -> pd.DataFrame:
+    """Parse the uploaded workbook. Cached on the file contents, so button clicks (reruns) don't reparse it,
+    and on disk as Parquet (see PARQUET_CACHE_DIR), so re-uploads don't either.
+    """
+    cache_dir = parquet_cache_dir()
+    if cache_dir is None:
+        return parse_excel(data)
 
-        # Also right-align all header cells for RTL readability
-        for cell in ws[1]:
-            cell.alignment = right_align
+    cache_path = os.path.join(cache_dir, f"{hashlib.sha1(data).hexdigest()}-v{PARSE_VERSION}.parquet")
+    if os.path.exists(cache_path):
+        try:
+            df = pd.read_parquet(cache_path)
+            os.utime(cache_path)  # the max age counts from the last use
+            return df
+        except Exception:
+            pass  # unreadable cache file (or no Parquet engine): parse the workbook again
+
+    df = parse_excel(data)
+    # The disk cache is best effort: no Parquet engine, a full disk or non-string
+    # headers just mean the next upload is parsed again
+    tmp_path = None
+    try:
+        prune_parquet_cache()
+        # Sessions are threads of one process, so each writer needs its own temp file;
+        # os.replace then swaps it in atomically and no session reads a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(fd)
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df
 
-    return output.getvalue()
 
+def build_preview_html(df: pd.DataFrame, highlights: Dict[str, np.ndarray]) -> str:
+    """HTML table of the first MAX_PREVIEW rows, built directly from the values and the highlight
+    bitmaps (no Styler). Cell values are escaped; empty cells are shown blank.
+    """
+    head = df.head(MAX_PREVIEW)
+    values = head.astype(object).where(head.notna(), "").to_numpy()
+    classes = np.full(values.shape, "ok", dtype=object)
+    for col_pos, col in enumerate(head.columns):
+        if col in highlights:
+            classes[highlights[col][: len(head)] != HL_NONE, col_pos] = "hl"
+
+    header = "".join(f"<th>{html.escape(str(name))}</th>" for name in head.columns)
+    body = "".join(
+        "<tr>" + "".join(f'<td class="{cls}">{html.escape(str(value))}</td>' for value, cls in zip(row, row_classes)) + "</tr>"
+        for row, row_classes in zip(values.tolist(), classes.tolist())
+    )
+    return f'<table class="preview-table"><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>'
 
-# -----------------------------
-# Streamlit UI
-# -----------------------------
 
 def main():
     st.set_page_config(page_title="Excel Validator", layout="wide")
@@ -515,8 +776,7 @@ def main():
         return
 
     try:
-        # Read as string to preserve formatting; we'll parse as needed
-        df = pd.read_excel(uploaded_file, dtype=str)
+        df = read_excel_file(uploaded_file.getvalue())
     except Exception as e:
         st.error(f"Could not read the Excel file: {e}")
         return
@@ -550,24 +810,23 @@ def main():
             st.error("Column 'final_value' not found in the uploaded file.")
 
     # Default outputs
-    out_df = df.copy()
-    highlights: Dict[Tuple[int, str], PatternFill] = {}
+    out_df = df
+    highlights: Dict[str, np.ndarray] = {}
     summary: List[str] = []
+    counts: Dict[str, int] = {}
 
     # Execute selected validation
     if do_final:
-        out_df, highlights, summary = validate_final_value_only(df.copy())
+        out_df, highlights, summary, counts = validate_final_value_only(df)
     elif do_mand:
-        out_df, highlights, summary = validate_mandatory_only(df.copy())
+        out_df, highlights, summary, counts = validate_mandatory_only(df)
     elif do_date:
-        out_df, highlights, summary = validate_dates_only(df.copy())
+        out_df, highlights, summary, counts = validate_dates_only(df)
     elif do_all:
-        out_df, highlights, summary = validate_all(df.copy())
+        out_df, highlights, summary, counts = validate_all(df)
 
     if do_final or do_mand or do_date or do_all:
-        total_issues = sum(int(s.split(":")[-1].strip()) for s in summary if ":" in s and s.split(":")[0] in [
-            "Final Value issues", "Missing mandatory values", "Invalid dates", "Additional rule violations"
-        ])
+        total_issues = sum(counts.values())
 
         # Show summary
         st.subheader("Summary")
@@ -586,7 +845,7 @@ def main():
 
         # Export with highlights and provide download
         try:
-            xlsx_bytes = export_with_highlights(out_df, highlights)
+            xlsx_bytes = export_with_highlights(out_df, highlights, hash_highlights(highlights))
             st.download_button(
                 label="Download Validated Excel",
                 data=xlsx_bytes,
@@ -597,44 +856,12 @@ def main():
             st.error(f"Error while generating the Excel file: {e}")
 
         # Show a styled preview table (Excel-like)
-        st.subheader("Preview (all rows)")
-
-        def highlight_excel(row):
-            row_styles = []
-            for col in out_df.columns:
-                key = (row.name, col)
-                if key in highlights:
-                    row_styles.append('background-color: #FFDE21; color: #111; border: 1px solid #bdbdbd;')
-                else:
-                    row_styles.append('background-color: #fff; color: #111; border: 1px solid #bdbdbd;')
-            return row_styles
-
-        styled = (
-            out_df.style
-            .apply(highlight_excel, axis=1)
-            .set_table_styles([
-                {'selector': 'th', 'props': [
-                    ('background-color', '#21a366'),
-                    ('color', '#fff'),
-                    ('font-weight', 'bold'),
-                    ('border', '1px solid #bdbdbd'),
-                    ('text-align', 'center')
-                ]},
-                {'selector': 'td', 'props': [
-                    ('border', '1px solid #bdbdbd'),
-                    ('text-align', 'center')
-                ]},
-                {'selector': 'table', 'props': [
-                    ('background-color', '#fff'),
-                    ('border-collapse', 'collapse'),
-                    ('font-family', 'Segoe UI, Arial, sans-serif'),
-                    ('font-size', '1em')
-                ]}
-            ])
-            .set_properties(**{'text-align': 'center'})
-        )
+        if len(out_df) > MAX_PREVIEW:
+            st.subheader(f"Preview (first {MAX_PREVIEW} of {len(out_df)} rows)")
+        else:
+            st.subheader("Preview (all rows)")
         st.markdown(
-            styled.to_html(escape=False, index=False),
+            PREVIEW_CSS + build_preview_html(out_df, highlights),
             unsafe_allow_html=True
         )
     else: